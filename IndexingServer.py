@@ -3,6 +3,8 @@ import asyncio
 from datetime import datetime
 import json
 
+from p2p_broker.protocol import FrameTooLargeError, MessageBuffer, frame
+
 class IndexingServer:
     def __init__(self, host, port) -> None:
         self.host = host
@@ -22,6 +24,7 @@ class IndexingServer:
         self.logging(f"Starting the Indexing Server at {self.host}:{self.port}")
         print(f"Starting the Indexing Server at {self.host}:{self.port}")
         server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]  # Resolve port 0 to the one actually bound
         async with server:
             self.logging("Indexing Server ready to accept connections")
             print("Indexing Server ready to accept connections")
@@ -31,18 +34,32 @@ class IndexingServer:
         addr = writer.get_extra_info('peername')
         print(f"[DEBUG] Connection established with {addr}")
         self.logging(f"Connected to {addr}")
+        buffer = MessageBuffer()
         while True:
             try:
                 print("Waiting to receive data")
-                data = await reader.read(1024)
+                data = await reader.read(65536)
                 if not data:
                     break
-                message = data.decode()
-                self.logging(f"Received message from {addr}: {message}")
-                print(f"Received message from {addr}: {message}")
-                response = await self.process_request(message)
-                print(f"[DEBUG] Sending response: {response}")
-                writer.write(response.encode())
+                try:
+                    messages = buffer.feed(data)
+                except FrameTooLargeError as e:
+                    # The stream can no longer be split into requests, report it once and hang up
+                    self.logging(f"Closing connection from {addr}: {e}")
+                    writer.write(frame({"status": "error", "message": str(e)}))
+                    await writer.drain()
+                    break
+                for message in messages:
+                    self.logging(f"Received message from {addr}: {message}")
+                    print(f"Received message from {addr}: {message}")
+                    try:
+                        response = await self.process_request(message)
+                    except Exception as e:
+                        # Answer with an error but keep the connection, it may carry other requests
+                        self.logging(f"Error processing request from {addr}: {e}")
+                        response = json.dumps({"status": "error", "message": f"Failed to process request: {e}"})
+                    print(f"[DEBUG] Sending response: {response}")
+                    writer.write(frame(response))
                 await writer.drain()
             except Exception as e:
                 print(f"Error handling connection: {e}")
@@ -3,28 +3,45 @@ import asyncio
 import json
 from datetime import datetime
 import socket
+import time
+
+from p2p_broker.protocol import FrameTooLargeError, MessageBuffer, frame
+from p2p_broker.retention import MAX_PULL_MESSAGES, RETENTION_CHUNK, RetentionPolicy, first_at_or_after, is_valid_key, make_record
 
 
 class PeerNode:
-    def __init__(self, host='localhost', port=5555, indexing_server_host='localhost', indexing_server_port=6000):
+    def __init__(self, host='localhost', port=5555, indexing_server_host='localhost', indexing_server_port=6000,
+                 retention_interval=1.0):
         self.host = host
         self.port = port
         self.indexing_server_host = indexing_server_host
         self.indexing_server_port = indexing_server_port
         self.topics = {}  # Store topics and messages
-        self.subscribers = {}  # Store which peers have subscribed to which topics
+        self.subscribers = {}  # Store which (host, port) subscribers follow which topics
+        self.pulled = {}  # Track which subscribers have pulled the current messages of a topic
+        self.retention = {}  # Retention policy of each topic that has one
+        self.topic_bytes = {}  # Approximate size of the messages stored per topic
+        self.next_offset = {}  # Offset the next message published to a topic will get
+        self.key_offsets = {}  # Offset of the newest message per key, for compacted topics
+        self.superseded = {}  # Messages per topic replaced by a newer one with the same key, not yet removed
+        self.uncompacted = set()  # Compacted topics with enough superseded messages to be worth rebuilding
+        self.retention_interval = retention_interval
         self.running = True
         self.log_file = f"peer_node_{port}.log"  # Log events
 
     async def start(self):
         # Start listening for connections
         server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]  # Resolve port 0 to the one actually bound
         print(f"Peer node running on {self.host}:{self.port}")
         self.log_event("Peer node started.")
 
         # Register with indexing server
         await self.register_with_indexing_server()
 
+        # Enforce topic retention policies in the background
+        asyncio.ensure_future(self.enforce_retention())
+
         # Start accepting connections
         async with server:
             await server.serve_forever()
@@ -34,17 +51,32 @@ class PeerNode:
         print(f"Connected by {addr}")
         self.log_event(f"Connected by {addr}")
 
+        buffer = MessageBuffer()
         while True:
-            data = await reader.read(1024)
+            data = await reader.read(65536)
             if not data:
                 break
-            message = data.decode()
-            print(f"Received: {message}")
-            self.log_event(f"Received message from {addr}: {message}")
-
-            # Process the request and send a response
-            response = await self.process_request(message)
-            writer.write(response.encode())
+            try:
+                messages = buffer.feed(data)
+            except FrameTooLargeError as e:
+                # The stream can no longer be split into requests, report it once and hang up
+                self.log_event(f"Closing connection from {addr}: {e}")
+                writer.write(frame({"status": "error", "message": str(e)}))
+                await writer.drain()
+                break
+            # A single read may carry several pipelined requests, answer them in order
+            for message in messages:
+                print(f"Received: {message}")
+                self.log_event(f"Received message from {addr}: {message}")
+
+                # Process the request and send a response; a failing request must not take
+                # down the connection, other pipelined requests may be sharing it
+                try:
+                    response = await self.process_request(message)
+                except Exception as e:
+                    self.log_event(f"Error processing request from {addr}: {e}")
+                    response = json.dumps({"status": "error", "message": f"Failed to process request: {e}"})
+                writer.write(frame(response))
             await writer.drain()
 
         writer.close()
@@ -56,7 +88,11 @@ class PeerNode:
             command = request.get('command')
             if command == "create_topic":
                 topic = request.get('topic')
-                return await self.create_topic(topic)
+                try:
+                    policy = RetentionPolicy.from_request(request)
+                except ValueError as e:
+                    return json.dumps({"status": "error", "message": f"Invalid retention policy: {e}"})
+                return await self.create_topic(topic, policy)
             elif command == "delete_topic":
                 topic = request.get('topic')
                 return await self.delete_topic(topic)
@@ -65,17 +101,31 @@ class PeerNode:
                 topic = request.get('topic')
                 msg = request.get('message')
                 print(msg)
-                return await self.publish(topic, msg)
+                return await self.publish(topic, msg, request.get('key'))
             elif command == "subscribe":
                 topic = request.get('topic')
                 return await self.subscribe(topic)
             elif command == "subscribe_to_peer":
                 topic = request.get('topic')
                 subscriber_port = request.get('subscriber_port')  # Get the subscriber's port
-                return await self.handle_subscription(topic, subscriber_port)  # Handle the subscription
+                subscriber_host = request.get('subscriber_host')  # Older peers only send the port
+                return await self.handle_subscription(topic, subscriber_port, subscriber_host)  # Handle the subscription
+            elif command == "unsubscribe_from_peer":
+                topic = request.get('topic')
+                subscriber_port = request.get('subscriber_port')
+                subscriber_host = request.get('subscriber_host')
+                return await self.handle_unsubscription(topic, subscriber_port, subscriber_host)
             elif command == "pull":
                 topic = request.get('topic')
-                return await self.pull(topic)
+                subscriber = (request.get('subscriber_host') or self.host, request.get('subscriber_port', self.port))
+                offset = request.get('offset')
+                if offset is not None and (isinstance(offset, bool) or not isinstance(offset, int)):
+                    return json.dumps({"status": "error", "message": "Offset must be an integer"})
+                max_messages = request.get('max_messages')
+                if max_messages is not None and (isinstance(max_messages, bool) or not isinstance(max_messages, int)
+                                                 or max_messages <= 0):
+                    return json.dumps({"status": "error", "message": "max_messages must be a positive integer"})
+                return await self.pull(topic, subscriber, offset, max_messages)
             elif command == "receive_message":  # Add this block to handle receive_message
                 topic = request.get('topic')
                 message = request.get('message')
@@ -88,11 +138,18 @@ class PeerNode:
         except json.JSONDecodeError:
             return json.dumps({"status": "error", "message": "Invalid JSON format"})
 
-    async def create_topic(self, topic):
+    async def create_topic(self, topic, policy=None):
         if topic in self.topics:
             return json.dumps({"status": "error", "message": "Topic already exists"})
         self.topics[topic] = []  # Empty list for messages
         self.subscribers[topic] = set()  # Track subscribers for this topic
+        self.pulled[topic] = set()
+        self.topic_bytes[topic] = 0
+        self.next_offset[topic] = 0
+        self.key_offsets[topic] = {}
+        self.superseded[topic] = 0
+        if policy is not None:
+            self.retention[topic] = policy
         await self.update_indexing_server("add_topic", topic)
         self.log_event(f"Created topic '{topic}'")
         return json.dumps({"status": "success", "message": f"Topic '{topic}' created"})
@@ -102,23 +159,33 @@ class PeerNode:
             return json.dumps({"status": "error", "message": "Topic does not exist"})
         del self.topics[topic]
         del self.subscribers[topic]
+        del self.pulled[topic]
+        del self.topic_bytes[topic]
+        del self.next_offset[topic]
+        del self.key_offsets[topic]
+        del self.superseded[topic]
+        self.retention.pop(topic, None)
+        self.uncompacted.discard(topic)
         await self.update_indexing_server("delete_topic", topic)
         self.log_event(f"Deleted topic '{topic}'")
         return json.dumps({"status": "success", "message": f"Topic '{topic}' deleted"})
 
-    async def publish(self, topic, message):
+    async def publish(self, topic, message, key=None):
         print("Hello from publish")
         print(f"Topic in publish function are: {self.topics}")
 
+        if not is_valid_key(key):
+            return json.dumps({"status": "error", "message": "Invalid key: must be a string or an integer"})
+
         # Check if the topic exists locally
         if topic in self.topics:
             # Store the message in the local topic
-            self.topics[topic].append(message)
+            self.store_message(topic, message, key)
             self.log_event(f"Published message on topic '{topic}': {message}")
             print(f"Topic in publish function are: {self.topics}")
 
             # Forward message to all subscribers
-            await self.forward_message_to_subscribers(topic, message)
+            await self.forward_message_to_subscribers(topic, message, key)
             return json.dumps({"status": "success", "message": f"Message published on topic '{topic}'"})
 
         # If the topic doesn't exist locally, query the indexing server
@@ -138,18 +205,45 @@ class PeerNode:
             return json.dumps({"status": "error", "message": f"Topic '{topic}' does not exist on this peer."})
 
         # Forward the publish request to the host of the topic
-        return await self.forward_publish(peer_host, peer_port, topic, message)
-
-    async def forward_message_to_subscribers(self, topic, message):
+        return await self.forward_publish(peer_host, peer_port, topic, message, key)
+
+    def store_message(self, topic, message, key=None):
+        """Append a message to a local topic; on compacted topics it supersedes the previous one with its key."""
+        record = make_record(message, key, self.next_offset[topic])
+        self.next_offset[topic] += 1
+        self.topics[topic].append(record)
+        self.topic_bytes[topic] += record["size"]
+        policy = self.retention.get(topic)
+        if key is not None and policy is not None and policy.compact:
+            previous = self.key_offsets[topic].get(key)
+            self.key_offsets[topic][key] = record["offset"]
+            if previous is not None:
+                self.supersede(topic, previous)
+        return record
+
+    def supersede(self, topic, offset):
+        """Hide the message at offset from reads and retention; compaction removes it from the list later."""
+        records = self.topics[topic]
+        index = first_at_or_after(records, offset)
+        if index == len(records) or records[index]["offset"] != offset or records[index].get("superseded"):
+            return  # Already dropped by retention
+        records[index]["superseded"] = True
+        self.topic_bytes[topic] -= records[index]["size"]
+        self.superseded[topic] += 1
+        # Rebuild once half the list is superseded, so each rebuild is paid for by the publishes before it
+        if self.superseded[topic] * 2 >= len(records):
+            self.uncompacted.add(topic)
+
+    async def forward_message_to_subscribers(self, topic, message, key=None):
         """Forward the message to all subscribers of the given topic."""
         print("Hi from forward message to subscribers")
         subscribers = self.subscribers.get(topic, [])
         print(f"Subscribers are: {subscribers}")
-        for subscriber_port in subscribers:
+        for subscriber_host, subscriber_port in subscribers:
             # Send the message to each subscriber
             try:
-                reader, writer = await asyncio.open_connection(self.host, subscriber_port)
-                publish_request = json.dumps({"command": "receive_message", "topic": topic, "message": message})
+                reader, writer = await asyncio.open_connection(subscriber_host, subscriber_port)
+                publish_request = json.dumps({"command": "receive_message", "topic": topic, "message": message, "key": key})
                 writer.write(publish_request.encode())
                 await writer.drain()
                 response = await reader.read(1024)
@@ -160,15 +254,23 @@ class PeerNode:
             except Exception as e:
                 print(f"Error sending message to subscriber {subscriber_port}: {e}")
                 
-    async def handle_subscription(self, topic, subscriber_port):
+    async def handle_subscription(self, topic, subscriber_port, subscriber_host=None):
         """Handle subscription requests from other peers."""
         if topic in self.topics:
-            # Add the subscriber port to the subscribers list for the topic
-            self.subscribers[topic].add(subscriber_port)
-            self.log_event(f"Peer {subscriber_port} subscribed to topic '{topic}'")
+            # Add the subscriber address to the subscribers list for the topic
+            self.subscribers[topic].add((subscriber_host or self.host, subscriber_port))
+            self.log_event(f"Peer {subscriber_host or self.host}:{subscriber_port} subscribed to topic '{topic}'")
             return json.dumps({"status": "success", "message": f"Subscribed to topic '{topic}'"})
         return json.dumps({"status": "error", "message": "Topic not found"})
 
+    async def handle_unsubscription(self, topic, subscriber_port, subscriber_host=None):
+        """Stop forwarding messages of a topic to a subscriber."""
+        if topic in self.topics:
+            self.subscribers[topic].discard((subscriber_host or self.host, subscriber_port))
+            self.log_event(f"Peer {subscriber_host or self.host}:{subscriber_port} unsubscribed from topic '{topic}'")
+            return json.dumps({"status": "success", "message": f"Unsubscribed from topic '{topic}'"})
+        return json.dumps({"status": "error", "message": "Topic not found"})
+
     async def subscribe(self, topic):
         peer_info = await self.query_indexing_server(topic)  # Find the host of the topic
         if peer_info:
@@ -180,19 +282,27 @@ class PeerNode:
                 return response
         return json.dumps({"status": "error", "message": "Topic not found"})
 
-    async def pull(self, topic):
+    async def pull(self, topic, subscriber=None, offset=None, max_messages=None):
         if topic in self.topics:
-            messages = self.topics[topic]
-            if messages:
-                # Mark that the subscriber has pulled the messages
-                self.subscribers[topic][self.port] = True
+            if topic in self.retention:
+                # Retention decides when messages go away, so subscribers read pages from an offset instead
+                page_size = min(max_messages or MAX_PULL_MESSAGES, MAX_PULL_MESSAGES)
+                return self.read_from_offset(topic, offset or 0, page_size)
+            records = self.topics[topic]
+            if records:
+                messages = [record["message"] for record in records]
                 self.log_event(f"Pulled messages from topic '{topic}': {messages}")
 
+                # Mark that the subscriber has pulled the messages
+                self.pulled[topic].add(subscriber or (self.host, self.port))
+
                 # Check if all subscribers have pulled the messages
-                all_pulled = all(self.subscribers[topic].values())
+                all_pulled = self.subscribers[topic] <= self.pulled[topic]
                 if all_pulled:
                     # Clear messages only if all subscribers have pulled
                     self.topics[topic] = []  # Clear messages after all subscribers have pulled
+                    self.topic_bytes[topic] = 0
+                    self.pulled[topic] = set()
                     self.log_event(f"All subscribers pulled messages, clearing messages for topic '{topic}'")
 
                 return json.dumps({"status": "success", "messages": messages})
@@ -200,21 +310,115 @@ class PeerNode:
                 return json.dumps({"status": "error", "message": "No messages to pull"})
         return json.dumps({"status": "error", "message": "Topic not found"})
 
+    def read_from_offset(self, topic, offset, max_messages):
+        """Return up to max_messages retained messages of a topic starting at offset, plus the offset to continue from."""
+        records = self.topics[topic]
+        index = first_at_or_after(records, offset)
+        page = []
+        # Superseded messages of compacted topics are still in the list until the next rebuild
+        while index < len(records) and len(page) < max_messages:
+            if not records[index].get("superseded"):
+                page.append(records[index])
+            index += 1
+        while index < len(records) and records[index].get("superseded"):
+            index += 1
+        more = index < len(records)
+        next_offset = records[index]["offset"] if more else self.next_offset[topic]
+        records = page
+        if not records:
+            return json.dumps({"status": "error", "message": "No messages to pull", "next_offset": next_offset})
+        messages = [record["message"] for record in records]
+        self.log_event(f"Pulled {len(messages)} messages from topic '{topic}' starting at offset {offset}")
+        response = {"status": "success", "messages": messages, "next_offset": next_offset, "more": more}
+        if self.retention[topic].compact:
+            response["keys"] = [record["key"] for record in records]
+        return json.dumps(response)
+
     async def auto_pull_messages(self, topic):
         """Periodically pull new messages for the topic."""
-        while self.port in self.subscribers.get(topic, []):  # Check if still subscribed
-            await asyncio.sleep(5)  # Poll every 5 seconds
-            response = await self.pull(topic)
-            messages = json.loads(response).get('messages', [])
+        offset = None
+        more = False
+        while (self.host, self.port) in self.subscribers.get(topic, []):  # Check if still subscribed
+            if not more:
+                await asyncio.sleep(5)  # Poll every 5 seconds, unless the last pull was one page of many
+            response = json.loads(await self.pull(topic, offset=offset))
+            offset = response.get('next_offset', offset)  # Only set for topics with retention
+            more = response.get('more', False)
+            messages = response.get('messages', [])
             if messages:
                 print(f"[AUTO-PULL] Pulled new messages for topic '{topic}': {messages}")
             # else:
             #     print(f"[AUTO-PULL] No new messages for topic '{topic}'.")
 
-    async def forward_publish(self, peer_host, peer_port, topic, message):
+    async def enforce_retention(self):
+        """Periodically apply each topic's retention policy."""
+        while self.running:
+            await asyncio.sleep(self.retention_interval)
+            for topic in list(self.retention):
+                try:
+                    await self.apply_retention(topic)
+                except Exception as e:
+                    print(f"Error enforcing retention for topic '{topic}': {e}")
+
+    async def apply_retention(self, topic):
+        """Compact, then drop expired or excess messages, yielding to other tasks between chunks."""
+        policy = self.retention.get(topic)
+        if policy is None:
+            return
+        # Superseded messages already stopped counting towards the byte limit when they were
+        # replaced, so the limit never trims away the only copy of an older key
+        if policy.compact and topic in self.uncompacted:
+            await self.compact_topic(topic)
+
+        dropped = 0
+        while topic in self.topics:
+            records = self.topics[topic]
+            count = policy.expired_prefix(records, self.topic_bytes[topic], time.time())
+            if count == 0:
+                break
+            for record in records[:count]:
+                if record.get("superseded"):
+                    self.superseded[topic] -= 1
+                    continue
+                self.topic_bytes[topic] -= record["size"]
+                if self.key_offsets[topic].get(record["key"]) == record["offset"]:
+                    del self.key_offsets[topic][record["key"]]
+            del records[:count]
+            dropped += count
+            await asyncio.sleep(0)
+        if dropped:
+            self.log_event(f"Retention removed {dropped} messages from topic '{topic}'")
+
+    async def compact_topic(self, topic):
+        """Remove superseded messages from a topic's list, a chunk at a time."""
+        records = self.topics[topic]
+        self.uncompacted.discard(topic)
+        kept = []
+        removed = 0
+        copied = 0
+        # Keep copying until caught up, so messages published in between are carried over too
+        while copied < len(records):
+            end = min(copied + RETENTION_CHUNK, len(records))
+            for index in range(copied, end):
+                if records[index].get("superseded"):
+                    removed += 1
+                else:
+                    kept.append(records[index])
+            copied = end
+            await asyncio.sleep(0)
+            if self.topics.get(topic) is not records:
+                self.uncompacted.add(topic)
+                return  # Topic was cleared or deleted meanwhile, the next round starts over
+
+        # Messages superseded after they were copied stay counted until the next rebuild
+        self.topics[topic] = kept
+        self.superseded[topic] -= removed
+        self.log_event(f"Compacted topic '{topic}' from {len(records)} to {len(kept)} messages")
+
+    async def forward_publish(self, peer_host, peer_port, topic, message, key=None):
         try:
             reader, writer = await asyncio.open_connection(peer_host, peer_port)
-            publish_request = json.dumps({"command": "publish", "topic": topic, "message": message})
+            publish_request = json.dumps({"command": "publish", "topic": topic, "message": message, "key": key})
             writer.write(publish_request.encode())
             await writer.drain()
             response = await reader.read(1024)
@@ -232,7 +436,8 @@ class PeerNode:
             subscribe_request = json.dumps({
                 "command": "subscribe_to_peer", 
                 "topic": topic, 
-                "subscriber_port": self.port  # Send this peer's port (e.g., 5557) to the host
+                "subscriber_port": self.port,  # Send this peer's port (e.g., 5557) to the host
+                "subscriber_host": self.host
             })
             writer.write(subscribe_request.encode())
             await writer.drain()
@@ -289,9 +494,12 @@ def main():
     parser.add_argument('--port', type=int, default=5555, help='Port to use for the peer node')
     parser.add_argument('--indexing_server_host', type=str, default='localhost', help='Indexing server host address')
     parser.add_argument('--indexing_server_port', type=int, default=6000, help='Indexing server port')
+    parser.add_argument('--retention_interval', type=float, default=1.0,
+                        help='Seconds between topic retention and compaction passes')
     args = parser.parse_args()
 
-    node = PeerNode(args.host, args.port, args.indexing_server_host, args.indexing_server_port)
+    node = PeerNode(args.host, args.port, args.indexing_server_host, args.indexing_server_port,
+                    args.retention_interval)
     try:
         asyncio.run(node.start())
     except KeyboardInterrupt:
@@ -0,0 +1 @@
+"""Shared building blocks for the P2P publisher-subscriber broker."""
@@ -0,0 +1,19 @@
+"""Client library for the P2P publisher-subscriber broker.
+
+AsyncBrokerClient is the asyncio implementation; BrokerClient wraps it for blocking code.
+"""
+from p2p_broker.client.async_client import AsyncBrokerClient
+from p2p_broker.client.errors import BrokerError
+from p2p_broker.client.producer import Producer
+from p2p_broker.client.subscription import Subscription
+from p2p_broker.client.sync_client import BrokerClient, SyncProducer, SyncSubscription
+
+__all__ = [
+    "AsyncBrokerClient",
+    "BrokerClient",
+    "BrokerError",
+    "Producer",
+    "Subscription",
+    "SyncProducer",
+    "SyncSubscription",
+]
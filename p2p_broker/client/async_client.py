@@ -0,0 +1,124 @@
+from p2p_broker.client.cache import TopicLocationCache
+from p2p_broker.client.pool import ConnectionPool
+from p2p_broker.client.producer import Producer
+from p2p_broker.client.subscription import Subscription
+
+
+class AsyncBrokerClient:
+    """Asyncio client for a peer node and the indexing server.
+
+    All requests go through a shared connection pool, so repeated calls reuse open
+    sockets instead of reconnecting. Publishes are routed straight to the peer that
+    hosts the topic, whose location is cached after the first indexing server query.
+    """
+
+    def __init__(self, host='localhost', port=5555, indexing_server_host='localhost', indexing_server_port=6000,
+                 max_connections_per_node=4, topic_cache_ttl=30.0):
+        self.host = host
+        self.port = port
+        self.indexing_server_host = indexing_server_host
+        self.indexing_server_port = indexing_server_port
+        self.pool = ConnectionPool(max_connections_per_node)
+        self.topic_cache = TopicLocationCache(topic_cache_ttl)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def request(self, command, host=None, port=None):
+        """Send a raw command dict to a node (the client's peer by default) and return the response."""
+        connection = await self.pool.acquire(host or self.host, port or self.port)
+        return await connection.request(command)
+
+    async def request_many(self, commands, host=None, port=None):
+        """Pipeline several commands on one connection and return their responses in order."""
+        connection = await self.pool.acquire(host or self.host, port or self.port)
+        return await connection.request_many(commands)
+
+    async def create_topic(self, topic, retention_seconds=None, retention_bytes=None, compact=False):
+        """Create a topic on the client's peer, optionally with a retention policy."""
+        command = {"command": "create_topic", "topic": topic}
+        if retention_seconds is not None:
+            command["retention_seconds"] = retention_seconds
+        if retention_bytes is not None:
+            command["retention_bytes"] = retention_bytes
+        if compact:
+            command["compact"] = True
+        response = await self.request(command)
+        if response.get("status") == "success":
+            self.topic_cache.put(topic, self.host, self.port)
+        return response
+
+    async def delete_topic(self, topic):
+        self.topic_cache.invalidate(topic)
+        host, port = await self.locate_topic(topic) or (self.host, self.port)
+        return await self.request({"command": "delete_topic", "topic": topic}, host, port)
+
+    async def locate_topic(self, topic):
+        """Return (host, port) of the peer hosting the topic, or None if it is unknown."""
+        location = self.topic_cache.get(topic)
+        if location is not None:
+            return location
+        response = await self.request({"command": "query_topic", "topic": topic},
+                                      self.indexing_server_host, self.indexing_server_port)
+        if response.get("status") != "success":
+            return None
+        self.topic_cache.put(topic, response.get("host"), response.get("port"))
+        return response.get("host"), response.get("port")
+
+    async def publish(self, topic, message, key=None):
+        return (await self.publish_many(topic, [message], None if key is None else [key]))[0]
+
+    async def publish_many(self, topic, messages, keys=None):
+        """Publish several messages (with optional compaction keys) to a topic as one pipelined burst."""
+        if keys is not None and len(keys) != len(messages):
+            raise ValueError(f"Got {len(keys)} keys for {len(messages)} messages")
+        location = await self.locate_topic(topic)
+        if location is None:
+            return [{"status": "error", "message": f"Topic '{topic}' not found"} for _ in messages]
+        keys = keys or [None] * len(messages)
+        commands = [{"command": "publish", "topic": topic, "message": message, "key": key}
+                    for message, key in zip(messages, keys)]
+        responses = await self.request_many(commands, *location)
+        if any(response.get("status") != "success" for response in responses):
+            # The topic may have moved or been deleted, look it up again next time
+            self.topic_cache.invalidate(topic)
+        return responses
+
+    async def subscribe(self, topic):
+        """Subscribe the client's peer node to a topic hosted elsewhere."""
+        return await self.request({"command": "subscribe", "topic": topic})
+
+    async def pull(self, topic, offset=None, max_messages=None):
+        """Pull messages of a topic.
+
+        Topics with retention are read in pages: pass the previous next_offset to continue,
+        and keep pulling while the response says there are more.
+        """
+        location = await self.locate_topic(topic) or (self.host, self.port)
+        command = {"command": "pull", "topic": topic}
+        if offset is not None:
+            command["offset"] = offset
+        if max_messages is not None:
+            command["max_messages"] = max_messages
+        return await self.request(command, *location)
+
+    def producer(self, topic, batch_size=100, linger=0.005):
+        """Return a Producer that batches publishes to a topic."""
+        return Producer(self, topic, batch_size, linger)
+
+    async def stream(self, topic, listen_host='localhost', listen_port=0, max_queue=0):
+        """Subscribe to a topic and return an async iterator over its new messages.
+
+        The hosting peer pushes messages to listen_host, so it must be reachable from that peer.
+        With max_queue set, a consumer that falls behind loses the oldest queued messages
+        (counted in Subscription.dropped) rather than slowing down publishers.
+        """
+        subscription = Subscription(self, topic, listen_host, listen_port, max_queue)
+        await subscription.start()
+        return subscription
+
+    async def close(self):
+        await self.pool.close()
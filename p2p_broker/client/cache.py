@@ -0,0 +1,28 @@
+import time
+
+
+class TopicLocationCache:
+    """Remembers which peer hosts a topic so lookups skip the indexing server."""
+
+    def __init__(self, ttl=30.0):
+        self.ttl = ttl
+        self.locations = {}  # topic -> ((host, port), expires_at)
+
+    def get(self, topic):
+        entry = self.locations.get(topic)
+        if entry is None:
+            return None
+        location, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self.locations[topic]
+            return None
+        return location
+
+    def put(self, topic, host, port):
+        self.locations[topic] = ((host, port), time.monotonic() + self.ttl)
+
+    def invalidate(self, topic):
+        self.locations.pop(topic, None)
+
+    def clear(self):
+        self.locations.clear()
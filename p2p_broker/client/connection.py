@@ -0,0 +1,105 @@
+import asyncio
+import json
+from collections import deque
+
+from p2p_broker.protocol import MessageBuffer, frame
+
+
+class Connection:
+    """A single TCP connection to a broker node.
+
+    Requests are written immediately and their responses are matched back in order,
+    so any number of requests can be in flight (pipelined) on the same connection.
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+        self.pending = deque()  # Futures waiting for a response, oldest first
+        self.read_task = None
+        self.closed = False
+
+    @property
+    def in_flight(self):
+        return len(self.pending)
+
+    async def open(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.read_task = asyncio.ensure_future(self.read_responses())
+        return self
+
+    def submit(self, command):
+        """Write one request and return a future for its response."""
+        return self.submit_many([command])[0]
+
+    def submit_many(self, commands):
+        """Write several requests in a single write and return one future per request."""
+        if self.closed:
+            raise ConnectionError(f"Connection to {self.host}:{self.port} is closed")
+        loop = asyncio.get_event_loop()
+        futures = []
+        for command in commands:
+            future = loop.create_future()
+            self.pending.append(future)
+            futures.append(future)
+        self.writer.write(b"".join(frame(command) for command in commands))
+        return futures
+
+    async def drain(self):
+        await self.writer.drain()
+
+    async def request(self, command):
+        future = self.submit(command)
+        await self.drain()
+        return await future
+
+    async def request_many(self, commands):
+        futures = self.submit_many(commands)
+        await self.drain()
+        return list(await asyncio.gather(*futures))
+
+    async def read_responses(self):
+        # Responses always end with a newline and may be large (a pull of a whole topic)
+        buffer = MessageBuffer(max_pending=None, legacy=False)
+        error = None
+        try:
+            while True:
+                data = await self.reader.read(65536)
+                if not data:
+                    break
+                for message in buffer.feed(data):
+                    if not self.pending:
+                        continue  # Unsolicited data, nothing is waiting for it
+                    future = self.pending.popleft()
+                    if future.done():
+                        continue
+                    try:
+                        future.set_result(json.loads(message))
+                    except json.JSONDecodeError:
+                        future.set_result({"status": "error", "message": "Invalid JSON format"})
+        except (ConnectionError, OSError) as e:
+            error = e
+        finally:
+            self.fail_pending(error)
+
+    def fail_pending(self, error=None):
+        self.closed = True
+        while self.pending:
+            future = self.pending.popleft()
+            if not future.done():
+                future.set_exception(ConnectionError(
+                    f"Connection to {self.host}:{self.port} lost: {error or 'closed by peer'}"))
+
+    async def close(self):
+        if self.writer is None:
+            return
+        self.closed = True
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+        if self.read_task is not None:
+            await self.read_task
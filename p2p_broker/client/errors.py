@@ -0,0 +1,2 @@
+class BrokerError(Exception):
+    """Raised when the broker rejects a request the client cannot fall back from."""
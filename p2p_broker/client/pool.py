@@ -0,0 +1,38 @@
+import asyncio
+
+from p2p_broker.client.connection import Connection
+
+
+class ConnectionPool:
+    """Keeps a small set of reusable connections per broker node.
+
+    Connections are shared rather than checked out: each request goes to the live
+    connection with the fewest in-flight requests, and a new connection is only
+    opened while every existing one is busy and the per-node limit is not reached.
+    """
+
+    def __init__(self, max_connections_per_node=4):
+        self.max_connections_per_node = max_connections_per_node
+        self.connections = {}  # (host, port) -> list of Connection
+        self.locks = {}  # (host, port) -> asyncio.Lock guarding connection setup
+
+    async def acquire(self, host, port):
+        node = (host, port)
+        if node not in self.locks:
+            self.locks[node] = asyncio.Lock()
+        async with self.locks[node]:
+            connections = [c for c in self.connections.get(node, []) if not c.closed]
+            self.connections[node] = connections
+            idle = [c for c in connections if c.in_flight == 0]
+            if idle:
+                return idle[0]
+            if len(connections) < self.max_connections_per_node:
+                connection = await Connection(host, port).open()
+                connections.append(connection)
+                return connection
+            return min(connections, key=lambda c: c.in_flight)
+
+    async def close(self):
+        connections = [c for node_connections in self.connections.values() for c in node_connections]
+        self.connections = {}
+        await asyncio.gather(*(c.close() for c in connections), return_exceptions=True)
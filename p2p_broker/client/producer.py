@@ -0,0 +1,94 @@
+import asyncio
+
+
+class Producer:
+    """Batches publishes to one topic.
+
+    send() queues a message and returns a future for its acknowledgement. Queued
+    messages are written as one pipelined burst once batch_size is reached or linger
+    seconds have passed since the first queued message, whichever comes first.
+    """
+
+    def __init__(self, client, topic, batch_size=100, linger=0.005):
+        self.client = client
+        self.topic = topic
+        self.batch_size = batch_size
+        self.linger = linger
+        self.batch = []  # (message, key, future) tuples waiting to be sent
+        self.linger_handle = None
+        self.in_flight = set()
+        self.connection = None
+        self.send_lock = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def send(self, message, key=None):
+        future = asyncio.get_event_loop().create_future()
+        self.batch.append((message, key, future))
+        if len(self.batch) >= self.batch_size:
+            self.schedule_flush()
+        elif self.linger_handle is None:
+            self.linger_handle = asyncio.get_event_loop().call_later(self.linger, self.schedule_flush)
+        return future
+
+    def schedule_flush(self):
+        if self.linger_handle is not None:
+            self.linger_handle.cancel()
+            self.linger_handle = None
+        if not self.batch:
+            return
+        batch, self.batch = self.batch, []
+        task = asyncio.ensure_future(self.send_batch(batch))
+        self.in_flight.add(task)
+        task.add_done_callback(self.in_flight.discard)
+
+    async def send_batch(self, batch):
+        if self.send_lock is None:
+            self.send_lock = asyncio.Lock()
+        try:
+            # Batches are written one after another on a single connection, so the
+            # broker sees messages in the order they were sent
+            async with self.send_lock:
+                location = await self.client.locate_topic(self.topic)
+                if location is None:
+                    for _, _, future in batch:
+                        if not future.done():
+                            future.set_result({"status": "error", "message": f"Topic '{self.topic}' not found"})
+                    return
+                if self.connection is None or self.connection.closed or \
+                        (self.connection.host, self.connection.port) != location:
+                    self.connection = await self.client.pool.acquire(*location)
+                futures = self.connection.submit_many(
+                    [{"command": "publish", "topic": self.topic, "message": message, "key": key}
+                     for message, key, _ in batch])
+                await self.connection.drain()
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, _, future), response_future in zip(batch, futures):
+            try:
+                response = await response_future
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                continue
+            if response.get("status") != "success":
+                self.client.topic_cache.invalidate(self.topic)
+            if not future.done():
+                future.set_result(response)
+
+    async def flush(self):
+        """Send everything queued so far and wait until it is acknowledged."""
+        self.schedule_flush()
+        while self.in_flight:
+            await asyncio.gather(*self.in_flight, return_exceptions=True)
+
+    async def close(self):
+        await self.flush()
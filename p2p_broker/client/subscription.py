@@ -0,0 +1,126 @@
+import asyncio
+import json
+
+from p2p_broker.client.errors import BrokerError
+from p2p_broker.protocol import FrameTooLargeError, MessageBuffer, frame
+
+# Marks the end of the stream in the message queue
+_CLOSED = object()
+
+
+class Subscription:
+    """Streams messages of a topic as they are published.
+
+    The subscription listens on its own port and registers listen_host and that port
+    with the peer hosting the topic, which then pushes every new message to it the same
+    way it does for subscribed peer nodes, so listen_host must be an address that peer
+    can connect to. Iterate with ``async for`` to consume the messages.
+
+    The host peer waits for each push before acknowledging the publish, so pushes never
+    wait for the consumer. With a bounded max_queue, a consumer that falls behind loses
+    the oldest queued messages instead; ``dropped`` counts them, and the lost range can
+    be read back with pull on topics that have a retention policy.
+    """
+
+    def __init__(self, client, topic, listen_host='localhost', listen_port=0, max_queue=0):
+        self.client = client
+        self.topic = topic
+        self.listen_host = listen_host
+        self.listen_port = listen_port
+        self.queue = asyncio.Queue(max_queue)
+        self.server = None
+        self.location = None
+        self.closed = False
+        self.dropped = 0  # Messages discarded because the consumer fell behind a full queue
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.closed and self.queue.empty():
+            raise StopAsyncIteration
+        message = await self.queue.get()
+        if message is _CLOSED:
+            raise StopAsyncIteration
+        return message
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_push, self.listen_host, self.listen_port)
+        self.listen_port = self.server.sockets[0].getsockname()[1]
+
+        self.location = await self.client.locate_topic(self.topic)
+        if self.location is None:
+            await self.stop_listening()
+            raise BrokerError(f"Topic '{self.topic}' not found")
+        response = await self.client.request(
+            {"command": "subscribe_to_peer", "topic": self.topic,
+             "subscriber_host": self.listen_host, "subscriber_port": self.listen_port},
+            *self.location)
+        if response.get("status") != "success":
+            self.client.topic_cache.invalidate(self.topic)
+            await self.stop_listening()
+            raise BrokerError(response.get("message", f"Failed to subscribe to topic '{self.topic}'"))
+
+    async def handle_push(self, reader, writer):
+        buffer = MessageBuffer()
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                for message in buffer.feed(data):
+                    try:
+                        request = json.loads(message)
+                    except json.JSONDecodeError:
+                        writer.write(frame({"status": "error", "message": "Invalid JSON format"}))
+                        continue
+                    if request.get("command") != "receive_message" or request.get("topic") != self.topic:
+                        writer.write(frame({"status": "error", "message": "Unknown command"}))
+                        continue
+                    if not self.closed:
+                        self.deliver(request.get("message"))
+                    writer.write(frame({"status": "success",
+                                        "message": f"Message '{request.get('message')}' received on topic '{self.topic}'"}))
+                await writer.drain()
+        except (ConnectionError, OSError, FrameTooLargeError):
+            pass
+        finally:
+            writer.close()
+
+    def deliver(self, message):
+        """Queue a pushed message without ever blocking the pushing peer."""
+        if self.queue.full():
+            # Drop the oldest message rather than stall every publisher of the topic
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+    async def stop_listening(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.location is not None:
+            try:
+                await self.client.request(
+                    {"command": "unsubscribe_from_peer", "topic": self.topic,
+                     "subscriber_host": self.listen_host, "subscriber_port": self.listen_port},
+                    *self.location)
+            except (ConnectionError, OSError):
+                pass
+        await self.stop_listening()
+        try:
+            self.queue.put_nowait(_CLOSED)  # Wake up a consumer waiting for the next message
+        except asyncio.QueueFull:
+            pass  # Nobody is waiting, iteration stops once the queue is drained
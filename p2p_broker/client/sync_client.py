@@ -0,0 +1,126 @@
+import asyncio
+import threading
+
+from p2p_broker.client.async_client import AsyncBrokerClient
+
+
+class BrokerClient:
+    """Blocking wrapper around AsyncBrokerClient for code that does not use asyncio.
+
+    The async client runs on a private event loop in a background thread, so pooled
+    connections, pipelining and topic-location caching work the same way here.
+    """
+
+    def __init__(self, host='localhost', port=5555, indexing_server_host='localhost', indexing_server_port=6000,
+                 max_connections_per_node=4, topic_cache_ttl=30.0):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.client = self.run(self._create_client(host, port, indexing_server_host, indexing_server_port,
+                                                   max_connections_per_node, topic_cache_ttl))
+
+    @staticmethod
+    async def _create_client(*args):
+        return AsyncBrokerClient(*args)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def run(self, coro):
+        """Run a coroutine on the client's event loop and wait for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def request(self, command, host=None, port=None):
+        return self.run(self.client.request(command, host, port))
+
+    def request_many(self, commands, host=None, port=None):
+        return self.run(self.client.request_many(commands, host, port))
+
+    def create_topic(self, topic, retention_seconds=None, retention_bytes=None, compact=False):
+        return self.run(self.client.create_topic(topic, retention_seconds, retention_bytes, compact))
+
+    def delete_topic(self, topic):
+        return self.run(self.client.delete_topic(topic))
+
+    def locate_topic(self, topic):
+        return self.run(self.client.locate_topic(topic))
+
+    def publish(self, topic, message, key=None):
+        return self.run(self.client.publish(topic, message, key))
+
+    def publish_many(self, topic, messages, keys=None):
+        return self.run(self.client.publish_many(topic, messages, keys))
+
+    def subscribe(self, topic):
+        return self.run(self.client.subscribe(topic))
+
+    def pull(self, topic, offset=None, max_messages=None):
+        return self.run(self.client.pull(topic, offset, max_messages))
+
+    def producer(self, topic, batch_size=100, linger=0.005):
+        return SyncProducer(self, self.client.producer(topic, batch_size, linger))
+
+    def stream(self, topic, listen_host='localhost', listen_port=0, max_queue=0):
+        return SyncSubscription(self, self.run(self.client.stream(topic, listen_host, listen_port, max_queue)))
+
+    def close(self):
+        if self.loop.is_closed():
+            return
+        self.run(self.client.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+class SyncProducer:
+    """Blocking view of a Producer; send() returns a concurrent.futures.Future."""
+
+    def __init__(self, broker_client, producer):
+        self.broker_client = broker_client
+        self.producer = producer
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def send(self, message, key=None):
+        async def send_and_wait():
+            return await self.producer.send(message, key)
+        return asyncio.run_coroutine_threadsafe(send_and_wait(), self.broker_client.loop)
+
+    def flush(self):
+        self.broker_client.run(self.producer.flush())
+
+    def close(self):
+        self.broker_client.run(self.producer.close())
+
+
+class SyncSubscription:
+    """Blocking iterator over a Subscription."""
+
+    def __init__(self, broker_client, subscription):
+        self.broker_client = broker_client
+        self.subscription = subscription
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return self.broker_client.run(self.subscription.__anext__())
+        except StopAsyncIteration:
+            raise StopIteration
+
+    def close(self):
+        self.broker_client.run(self.subscription.close())
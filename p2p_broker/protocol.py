@@ -0,0 +1,53 @@
+import json
+
+# Upper bound for a single request that is still waiting for its terminator
+MAX_PENDING_BYTES = 1024 * 1024
+
+
+class FrameTooLargeError(ValueError):
+    """Raised when a peer sends more than the allowed bytes without ending the message."""
+
+
+def frame(message):
+    """Encode a JSON message (dict or already-serialised str) as one newline-terminated frame."""
+    if not isinstance(message, str):
+        message = json.dumps(message)
+    return (message.rstrip("\n") + "\n").encode()
+
+
+class MessageBuffer:
+    """Reassemble JSON messages from a TCP byte stream.
+
+    Messages are delimited by newlines so several requests can be pipelined on one
+    connection. Until the first newline is seen, a message without one is also accepted
+    as soon as it parses as complete JSON, which keeps one-shot clients (and ncat) working.
+    Pass max_pending=None to accept messages of any size, and legacy=False when the other
+    side always terminates its messages.
+    """
+
+    def __init__(self, max_pending=MAX_PENDING_BYTES, legacy=True):
+        self.max_pending = max_pending
+        self.legacy = legacy
+        self.pending = b""
+
+    def feed(self, data):
+        # Split on bytes, not text, so a multi-byte character cut by a read boundary survives
+        self.pending += data
+        *lines, self.pending = self.pending.split(b"\n")
+        if lines:
+            self.legacy = False  # The sender frames its messages, so never guess at partial ones
+        messages = [line.decode(errors="replace") for line in lines if line.strip()]
+
+        if self.legacy and self.pending.strip():
+            try:
+                json.loads(self.pending)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                pass
+            else:
+                messages.append(self.pending.decode())
+                self.pending = b""
+
+        if self.max_pending is not None and len(self.pending) > self.max_pending:
+            self.pending = b""
+            raise FrameTooLargeError(f"Message exceeds {self.max_pending} bytes")
+        return messages
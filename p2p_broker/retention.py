@@ -0,0 +1,81 @@
+import json
+import time
+
+# Records handled per step before the retention task yields back to the event loop
+RETENTION_CHUNK = 1000
+
+# Most messages a single pull returns from a topic with retention, larger logs are read in pages
+MAX_PULL_MESSAGES = 1000
+
+
+class RetentionPolicy:
+    """Per-topic retention settings given at create_topic.
+
+    retention_seconds drops messages older than that, retention_bytes drops the oldest
+    messages once the topic holds more than that many bytes, and compact keeps only the
+    newest message for each key. Messages published without a key are never compacted.
+    """
+
+    def __init__(self, retention_seconds=None, retention_bytes=None, compact=False):
+        self.retention_seconds = retention_seconds
+        self.retention_bytes = retention_bytes
+        self.compact = compact
+
+    @classmethod
+    def from_request(cls, request):
+        """Build a policy from create_topic fields, None if the request sets none of them."""
+        retention_seconds = request.get('retention_seconds')
+        retention_bytes = request.get('retention_bytes')
+        compact = request.get('compact', False)
+        for name, value in (("retention_seconds", retention_seconds), ("retention_bytes", retention_bytes)):
+            if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0):
+                raise ValueError(f"'{name}' must be a positive number")
+        if not isinstance(compact, bool):
+            raise ValueError("'compact' must be true or false")
+        if retention_seconds is None and retention_bytes is None and not compact:
+            return None
+        return cls(retention_seconds, retention_bytes, compact)
+
+    def expired_prefix(self, records, stored_bytes, now):
+        """Count the records at the head of a topic this policy drops, scanning at most one chunk."""
+        excess = stored_bytes - self.retention_bytes if self.retention_bytes is not None else 0
+        count = 0
+        while count < min(len(records), RETENTION_CHUNK):
+            record = records[count]
+            if record.get("superseded"):
+                count += 1  # Already replaced by a newer message with its key, free to drop
+                continue
+            too_old = self.retention_seconds is not None and record["timestamp"] < now - self.retention_seconds
+            if not too_old and excess <= 0:
+                break
+            excess -= record["size"]
+            count += 1
+        return count
+
+
+def is_valid_key(key):
+    """Compaction keys must be hashable and compare like their JSON form, so only strings and integers."""
+    return key is None or isinstance(key, str) or (isinstance(key, int) and not isinstance(key, bool))
+
+
+def first_at_or_after(records, offset):
+    """Index of the first record with an offset of at least offset (offsets only grow along a topic)."""
+    low, high = 0, len(records)
+    while low < high:
+        middle = (low + high) // 2
+        if records[middle]["offset"] < offset:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def make_record(message, key=None, offset=0):
+    """Wrap a published message with the metadata retention needs."""
+    return {
+        "message": message,
+        "key": key,
+        "offset": offset,
+        "timestamp": time.time(),
+        "size": len(json.dumps([key, message]).encode()),
+    }
@@ -1,43 +1,16 @@
-import socket
-import json
+from p2p_broker.client import BrokerClient
 
-def send_command(command, peer_host='localhost', peer_port=5555):
-    # Create a socket connection to the peer node
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client_socket:
-        client_socket.connect((peer_host, peer_port))
-        # Send the command (convert dictionary to JSON string)
-        client_socket.sendall(json.dumps(command).encode('utf-8'))
-        # Receive and print the response
-        response = client_socket.recv(1024).decode('utf-8')
-        print(f"Response: {response}")
+# Example usage (one client, one reused connection for every command):
 
-# Example usage:
+with BrokerClient('localhost', 5555) as client:
+    # Create topic
+    print(f"Response: {client.create_topic('Sports')}")
 
-# Create topic
-create_topic_cmd = {
-    "command": "create_topic",
-    "topic": "Sports"
-}
-send_command(create_topic_cmd)
+    # Publish message to topic
+    print(f"Response: {client.publish('Sports', 'Football match tonight!')}")
 
-# Publish message to topic
-publish_cmd = {
-    "command": "publish",
-    "topic": "Sports",
-    "message": "Football match tonight!"
-}
-send_command(publish_cmd)
+    # Subscribe to topic
+    print(f"Response: {client.subscribe('Sports')}")
 
-# Subscribe to topic
-subscribe_cmd = {
-    "command": "subscribe",
-    "topic": "Sports"
-}
-send_command(subscribe_cmd)
-
-# Pull messages from topic
-pull_cmd = {
-    "command": "pull",
-    "topic": "Sports"
-}
-send_command(pull_cmd)
+    # Pull messages from topic
+    print(f"Response: {client.pull('Sports')}")
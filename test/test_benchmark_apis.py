@@ -1,16 +1,11 @@
 import asyncio
-import json
 import time
 
-# Helper function to send a command to a peer
-async def send_command(host, port, command):
-    reader, writer = await asyncio.open_connection(host, port)
-    writer.write(command.encode())
-    await writer.drain()
-    response = await reader.read(1024)
-    writer.close()
-    await writer.wait_closed()
-    return json.loads(response.decode())
+from p2p_broker.client import AsyncBrokerClient
+
+# Shared clients so the benchmarks measure the broker instead of connection setup
+publisher = AsyncBrokerClient(port=5555)
+subscriber = AsyncBrokerClient(port=5556)
 
 async def benchmark_latency(api_function, num_requests):
     total_time = 0
@@ -34,18 +29,15 @@ async def benchmark_throughput(api_function, num_requests):
 
 # Test create topic
 async def create_topic():
-    command = json.dumps({"command": "create_topic", "topic": "Sports"})
-    await send_command("localhost", 5555, command)
+    await publisher.create_topic("Sports")
 
 # Test subscribe to a topic
 async def subscribe_peer():
-    command = json.dumps({"command": "subscribe", "topic": "Sports"})
-    await send_command("localhost", 5556, command)
+    await subscriber.subscribe("Sports")
 
 # Test publish message
 async def publish_message():
-    command = json.dumps({"command": "publish", "topic": "Sports", "message": "Football match tonight!"})
-    await send_command("localhost", 5555, command)
+    await publisher.publish("Sports", "Football match tonight!")
 
 async def run_benchmarks():
     num_requests = 1000
@@ -60,5 +52,16 @@ async def run_benchmarks():
     await benchmark_throughput(subscribe_peer, num_requests)
     await benchmark_throughput(publish_message, num_requests)
 
+    # Benchmark pipelined throughput with a batching producer
+    start_time = time.time()
+    async with publisher.producer("Sports") as producer:
+        acks = [producer.send("Football match tonight!") for _ in range(num_requests)]
+    await asyncio.gather(*acks)
+    end_time = time.time()
+    print(f"Throughput for batched publish_message: {num_requests / (end_time - start_time):.2f} requests/second")
+
+    await publisher.close()
+    await subscriber.close()
+
 if __name__ == "__main__":
     asyncio.run(run_benchmarks())
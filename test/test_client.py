@@ -0,0 +1,224 @@
+import asyncio
+import time
+
+import pytest
+
+from IndexingServer import IndexingServer
+from PeerNode import PeerNode
+from p2p_broker.client import AsyncBrokerClient, BrokerClient
+from p2p_broker.client.cache import TopicLocationCache
+from p2p_broker.client.pool import ConnectionPool
+from p2p_broker.retention import make_record
+
+HOST = "127.0.0.1"
+
+
+async def wait_until(condition, timeout=5):
+    deadline = asyncio.get_event_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_event_loop().time() < deadline, "timed out waiting for the broker"
+        await asyncio.sleep(0.01)
+
+
+def run_with_broker(tmp_path, scenario, peers=2):
+    """Run scenario(index, nodes) against an in-process indexing server and peers on ephemeral ports."""
+    async def run():
+        index = IndexingServer(HOST, 0)
+        index.log_file = str(tmp_path / "indexing_server.log")
+        tasks = [asyncio.ensure_future(index.start_server())]
+        nodes = []
+        try:
+            await wait_until(lambda: index.port != 0)
+            for number in range(peers):
+                node = PeerNode(HOST, 0, HOST, index.port, retention_interval=0.05)
+                node.log_file = str(tmp_path / f"peer_node_{number}.log")
+                tasks.append(asyncio.ensure_future(node.start()))
+                nodes.append(node)
+            await wait_until(lambda: all(node.port and (HOST, node.port) in index.peers for node in nodes))
+            return await scenario(index, nodes)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    return asyncio.run(run())
+
+
+def client_for(index, node, **kwargs):
+    return AsyncBrokerClient(HOST, node.port, HOST, index.port, **kwargs)
+
+
+def test_slow_stream_consumer_does_not_block_publishers(tmp_path):
+    async def scenario(index, nodes):
+        async with client_for(index, nodes[0]) as client:
+            await client.create_topic("Sports")
+            subscription = await client.stream("Sports", listen_host=HOST, max_queue=2)
+            # Nobody consumes while publishing, yet every publish is acknowledged promptly
+            responses = await asyncio.wait_for(client.publish_many("Sports", list(range(5))), 5)
+            received = [await asyncio.wait_for(subscription.__anext__(), 5) for _ in range(2)]
+            dropped = subscription.dropped
+            await subscription.close()
+            return responses, received, dropped
+
+    responses, received, dropped = run_with_broker(tmp_path, scenario)
+    assert all(response["status"] == "success" for response in responses)
+    assert received == [3, 4]
+    assert dropped == 3
+
+
+def messages_on(node, topic):
+    return [record["message"] for record in node.topics[topic]]
+
+
+def test_pool_reuses_idle_connections_honours_limit_and_drops_closed():
+    async def run():
+        async def never_answer(reader, writer):
+            await reader.read()
+            writer.close()
+
+        server = await asyncio.start_server(never_answer, HOST, 0)
+        port = server.sockets[0].getsockname()[1]
+        pool = ConnectionPool(max_connections_per_node=2)
+        try:
+            first = await pool.acquire(HOST, port)
+            assert await pool.acquire(HOST, port) is first  # Idle, so it is reused
+
+            first.submit({"command": "pull"})
+            second = await pool.acquire(HOST, port)
+            assert second is not first  # First is busy and the limit allows another
+
+            second.submit({"command": "pull"})
+            second.submit({"command": "pull"})
+            assert await pool.acquire(HOST, port) is first  # At the limit, least busy wins
+            assert len(pool.connections[(HOST, port)]) == 2
+
+            await first.close()
+            replacement = await pool.acquire(HOST, port)
+            assert replacement is not first
+            assert first not in pool.connections[(HOST, port)]
+        finally:
+            await pool.close()
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(run())
+
+
+def test_topic_location_cache_expires_and_invalidates():
+    cache = TopicLocationCache(ttl=0.05)
+    cache.put("Sports", HOST, 5555)
+    cache.put("News", HOST, 5556)
+    assert cache.get("Sports") == (HOST, 5555)
+    cache.invalidate("News")
+    assert cache.get("News") is None
+    time.sleep(0.06)
+    assert cache.get("Sports") is None
+
+
+def test_publish_many_routes_to_host_and_invalidates_stale_location(tmp_path):
+    async def scenario(index, nodes):
+        async with client_for(index, nodes[0]) as owner, client_for(index, nodes[1]) as client:
+            await owner.create_topic("Sports")
+            responses = await client.publish_many("Sports", ["a", "b", "c"])
+            location = client.topic_cache.get("Sports")
+            with pytest.raises(ValueError):
+                await client.publish_many("Sports", ["a"], keys=["x", "y"])
+            stored = messages_on(nodes[0], "Sports")
+
+            await owner.delete_topic("Sports")
+            stale = await client.publish("Sports", "d")
+            return responses, location, stored, stale, client.topic_cache.get("Sports")
+
+    responses, location, stored, stale, cached = run_with_broker(tmp_path, scenario)
+    assert [response["status"] for response in responses] == ["success"] * 3
+    assert stored == ["a", "b", "c"]
+    assert stale["status"] == "error"
+    assert cached is None
+
+
+def test_large_pull_response_keeps_connection_in_step(tmp_path):
+    async def scenario(index, nodes):
+        async with client_for(index, nodes[0], max_connections_per_node=1) as client:
+            await client.create_topic("Big", retention_seconds=3600)
+            # Seed directly, publishing 1.4 MB one message at a time only slows the test down
+            nodes[0].topics["Big"] = [make_record("x" * 2000, offset=offset) for offset in range(700)]
+            nodes[0].next_offset["Big"] = 700
+            pulled = await client.pull("Big", max_messages=700)
+            created = await client.create_topic("Next")
+            return pulled, created
+
+    pulled, created = run_with_broker(tmp_path, scenario)
+    assert len(pulled["messages"]) == 700
+    assert created == {"status": "success", "message": "Topic 'Next' created"}
+
+
+def test_producer_batches_by_size_and_linger_in_order(tmp_path):
+    async def scenario(index, nodes):
+        async with client_for(index, nodes[0]) as client:
+            await client.create_topic("Sports")
+            producer = client.producer("Sports", batch_size=10, linger=30)
+            futures = [producer.send(i) for i in range(25)]
+            # Two full batches go out at once, the remaining five wait for linger or flush
+            await asyncio.wait_for(asyncio.gather(*futures[:20]), 5)
+            await asyncio.sleep(0.1)
+            waiting = [future.done() for future in futures[20:]]
+            await producer.flush()
+
+            lingering = client.producer("Sports", batch_size=1000, linger=0.05)
+            await asyncio.wait_for(lingering.send(25), 5)
+            return waiting, [future.result()["status"] for future in futures], messages_on(nodes[0], "Sports")
+
+    waiting, statuses, stored = run_with_broker(tmp_path, scenario)
+    assert not any(waiting)
+    assert statuses == ["success"] * 25
+    assert stored == list(range(26))
+
+
+def test_subscription_streams_messages_and_unsubscribes_on_close(tmp_path):
+    async def scenario(index, nodes):
+        async with client_for(index, nodes[0]) as owner, client_for(index, nodes[1]) as client:
+            await owner.create_topic("Sports")
+            subscription = await client.stream("Sports", listen_host=HOST)
+            address = (HOST, subscription.listen_port)
+            subscribed = address in nodes[0].subscribers["Sports"]
+            await owner.publish_many("Sports", ["a", "b", "c"])
+            received = []
+            async for message in subscription:
+                received.append(message)
+                if len(received) == 3:
+                    break
+            await subscription.close()
+            remaining = [message async for message in subscription]
+            return subscribed, received, remaining, address in nodes[0].subscribers["Sports"]
+
+    subscribed, received, remaining, still_subscribed = run_with_broker(tmp_path, scenario)
+    assert subscribed
+    assert received == ["a", "b", "c"]
+    assert remaining == []
+    assert not still_subscribed
+
+
+def test_sync_wrappers(tmp_path):
+    def use_sync_client(index_port, node_port):
+        with BrokerClient(HOST, node_port, HOST, index_port) as client:
+            created = client.create_topic("Sync")
+            stream = client.stream("Sync", listen_host=HOST)
+            with client.producer("Sync", batch_size=2) as producer:
+                futures = [producer.send(i) for i in range(3)]
+            acks = [future.result(5)["status"] for future in futures]
+            received = [next(stream) for _ in range(3)]
+            stream.close()
+            rest = list(stream)
+            pulled = client.pull("Sync")
+        return created, acks, received, rest, pulled
+
+    async def scenario(index, nodes):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, use_sync_client, index.port, nodes[0].port)
+
+    created, acks, received, rest, pulled = run_with_broker(tmp_path, scenario)
+    assert created["status"] == "success"
+    assert acks == ["success"] * 3
+    assert received == [0, 1, 2]
+    assert rest == []
+    assert pulled["messages"] == [0, 1, 2]
@@ -2,15 +2,15 @@ import asyncio
 import json
 import time
 
-# Helper function to send a command to a peer
+from p2p_broker.client import AsyncBrokerClient
+
+clients = {}
+
+# Helper function to send a command to a peer, reusing one client per peer
 async def send_command(host, port, command):
-    reader, writer = await asyncio.open_connection(host, port)
-    writer.write(command.encode())
-    await writer.drain()
-    response = await reader.read(1024)
-    writer.close()
-    await writer.wait_closed()
-    return json.loads(response.decode())
+    if (host, port) not in clients:
+        clients[(host, port)] = AsyncBrokerClient(host, port)
+    return await clients[(host, port)].request(json.loads(command))
 
 async def test_create_topic():
     command = json.dumps({"command": "create_topic", "topic": "Sports"})
@@ -61,5 +61,8 @@ async def run_tests():
     # Test deleting the topic
     await test_delete_topic()
 
+    for client in clients.values():
+        await client.close()
+
 if __name__ == "__main__":
     asyncio.run(run_tests())
@@ -0,0 +1,159 @@
+import asyncio
+import json
+
+import pytest
+
+from p2p_broker.client.connection import Connection
+from p2p_broker.protocol import MAX_PENDING_BYTES, FrameTooLargeError, MessageBuffer, frame
+
+
+def test_several_frames_in_one_read():
+    buffer = MessageBuffer()
+    data = frame({"command": "pull", "topic": "a"}) + frame({"command": "pull", "topic": "b"})
+    messages = buffer.feed(data)
+    assert [json.loads(m)["topic"] for m in messages] == ["a", "b"]
+    assert buffer.pending == b""
+
+
+def test_frame_split_across_reads():
+    buffer = MessageBuffer()
+    message = json.dumps({"command": "publish", "topic": "Sports", "message": "Fútbol"}, ensure_ascii=False)
+    data = (message + "\n").encode()
+    # Cut inside the two-byte 'ú' so the character spans both reads
+    cut = data.index("ú".encode()) + 1
+    assert buffer.feed(data[:cut]) == []
+    messages = buffer.feed(data[cut:])
+    assert len(messages) == 1
+    assert json.loads(messages[0])["message"] == "Fútbol"
+
+
+def test_legacy_request_without_newline():
+    buffer = MessageBuffer()
+    messages = buffer.feed(json.dumps({"command": "create_topic", "topic": "Sports"}).encode())
+    assert len(messages) == 1
+    assert json.loads(messages[0])["topic"] == "Sports"
+    assert buffer.pending == b""
+
+
+def test_incomplete_request_waits_for_more_data():
+    buffer = MessageBuffer()
+    assert buffer.feed(b'{"command": "pu') == []
+    assert buffer.feed(b'll", "topic": "Sports"}') == ['{"command": "pull", "topic": "Sports"}']
+
+
+def test_blank_lines_are_skipped():
+    assert MessageBuffer().feed(b'\n\n{"a": 1}\n\n') == ['{"a": 1}']
+
+
+def test_frame_does_not_double_newlines():
+    assert frame('{"status": "success"}\n') == b'{"status": "success"}\n'
+
+
+async def start_echo_server(delay_first=False):
+    """Answer every request with its 'id', optionally holding back the first answer."""
+    async def handle(reader, writer):
+        buffer = MessageBuffer()
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            for message in buffer.feed(data):
+                request = json.loads(message)
+                if delay_first and request["id"] == 0:
+                    await asyncio.sleep(0.05)
+                writer.write(frame({"status": "success", "id": request["id"]}))
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "localhost", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def test_request_many_matches_responses_in_order():
+    async def run():
+        server, port = await start_echo_server(delay_first=True)
+        connection = await Connection("localhost", port).open()
+        try:
+            responses = await connection.request_many([{"id": i} for i in range(50)])
+            single = await connection.request({"id": 99})
+        finally:
+            await connection.close()
+            server.close()
+            await server.wait_closed()
+        return responses, single
+
+    responses, single = asyncio.run(run())
+    assert [response["id"] for response in responses] == list(range(50))
+    assert single["id"] == 99
+
+
+def test_pending_requests_fail_when_connection_drops():
+    async def run():
+        async def hang_up(reader, writer):
+            await reader.read(65536)
+            writer.close()
+
+        server = await asyncio.start_server(hang_up, "localhost", 0)
+        port = server.sockets[0].getsockname()[1]
+        connection = await Connection("localhost", port).open()
+        futures = connection.submit_many([{"id": 1}, {"id": 2}])
+        await connection.drain()
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        closed = connection.closed
+        with pytest.raises(ConnectionError):
+            connection.submit({"id": 3})
+        await connection.close()
+        server.close()
+        await server.wait_closed()
+        return results, closed
+
+    results, closed = asyncio.run(run())
+    assert all(isinstance(result, ConnectionError) for result in results)
+    assert closed
+
+
+def test_large_frame_split_across_reads_stays_one_message():
+    buffer = MessageBuffer(max_pending=None, legacy=False)
+    data = frame({"status": "success", "messages": ["x" * 2000] * 1000})
+    assert len(data) > MAX_PENDING_BYTES
+    messages = []
+    for start in range(0, len(data), 65536):
+        messages += buffer.feed(data[start:start + 65536])
+    assert len(messages) == 1
+    assert len(json.loads(messages[0])["messages"]) == 1000
+
+
+def test_oversized_request_raises_once():
+    buffer = MessageBuffer(max_pending=1000)
+    assert buffer.feed(b'{"command": "publish", "message": "' + b"x" * 900) == []
+    with pytest.raises(FrameTooLargeError):
+        buffer.feed(b"x" * 200)
+    assert buffer.pending == b""
+
+
+def test_no_legacy_guessing_once_frames_have_been_seen():
+    buffer = MessageBuffer()
+    assert buffer.feed(b'{"a": 1}\n{"b": 2}') == ['{"a": 1}']
+    assert buffer.feed(b"\n") == ['{"b": 2}']
+
+
+def test_server_answers_oversized_request_once_and_closes(tmp_path):
+    from PeerNode import PeerNode
+
+    async def run():
+        node = PeerNode()
+        node.log_file = str(tmp_path / "peer_node.log")
+        server = await asyncio.start_server(node.handle_connection, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b'{"command": "publish", "topic": "Sports", "message": "' + b"x" * (MAX_PENDING_BYTES + 10))
+        await writer.drain()
+        data = await asyncio.wait_for(reader.read(), 5)  # Until the server hangs up
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return data
+
+    responses = MessageBuffer().feed(asyncio.run(run()))
+    assert len(responses) == 1
+    assert json.loads(responses[0])["status"] == "error"
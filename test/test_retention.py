@@ -0,0 +1,274 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from PeerNode import PeerNode
+from p2p_broker.retention import MAX_PULL_MESSAGES, RETENTION_CHUNK, RetentionPolicy, first_at_or_after, make_record
+
+
+def make_node(tmp_path):
+    node = PeerNode()
+    node.log_file = str(tmp_path / "peer_node.log")
+
+    async def skip_indexing_server(operation, topic):
+        pass
+
+    node.update_indexing_server = skip_indexing_server
+    return node
+
+
+def stored(node, topic):
+    return [(record["key"], record["message"]) for record in node.topics[topic]]
+
+
+@pytest.mark.parametrize("request_fields", [
+    {"retention_seconds": 0},
+    {"retention_seconds": -5},
+    {"retention_seconds": "60"},
+    {"retention_bytes": True},
+    {"compact": "yes"},
+])
+def test_invalid_policies_are_rejected(request_fields):
+    with pytest.raises(ValueError):
+        RetentionPolicy.from_request(request_fields)
+
+
+def test_topic_without_retention_fields_has_no_policy():
+    assert RetentionPolicy.from_request({"topic": "Sports"}) is None
+
+
+def test_create_topic_reports_invalid_policy(tmp_path):
+    node = make_node(tmp_path)
+    request = json.dumps({"command": "create_topic", "topic": "Sports", "retention_bytes": -1})
+    response = json.loads(asyncio.run(node.process_request(request)))
+    assert response["status"] == "error"
+    assert "Sports" not in node.topics
+
+
+def test_make_record_tracks_size_and_offset():
+    record = make_record("hello", "k", offset=7)
+    assert record["offset"] == 7
+    assert record["size"] == len(json.dumps(["k", "hello"]).encode())
+    assert record["timestamp"] <= time.time()
+
+
+def test_time_expiry_drops_only_old_messages():
+    policy = RetentionPolicy(retention_seconds=10)
+    records = [make_record(i) for i in range(5)]
+    for record in records[:3]:
+        record["timestamp"] -= 60
+    assert policy.expired_prefix(records, sum(r["size"] for r in records), time.time()) == 3
+
+
+def test_byte_limit_drops_oldest_until_under_limit():
+    records = [make_record("x" * 10) for _ in range(10)]
+    size = records[0]["size"]
+    policy = RetentionPolicy(retention_bytes=size * 4)
+    assert policy.expired_prefix(records, size * 10, time.time()) == 6
+
+
+def test_expired_prefix_is_bounded_by_one_chunk():
+    policy = RetentionPolicy(retention_bytes=1)
+    records = [make_record(i) for i in range(RETENTION_CHUNK + 10)]
+    assert policy.expired_prefix(records, sum(r["size"] for r in records), time.time()) == RETENTION_CHUNK
+
+
+def test_first_at_or_after():
+    records = [make_record(i, offset=offset) for i, offset in enumerate([2, 5, 6, 9])]
+    assert [first_at_or_after(records, offset) for offset in (0, 5, 7, 9, 10)] == [0, 1, 3, 3, 4]
+
+
+def test_apply_retention_trims_by_time_and_bytes(tmp_path):
+    node = make_node(tmp_path)
+
+    async def run():
+        await node.create_topic("Aged", RetentionPolicy(retention_seconds=10))
+        await node.create_topic("Sized", RetentionPolicy(retention_bytes=100))
+        for i in range(5):
+            await node.publish("Aged", i)
+        for record in node.topics["Aged"][:2]:
+            record["timestamp"] -= 60
+        for i in range(50):
+            await node.publish("Sized", f"message-{i}")
+        await node.apply_retention("Aged")
+        await node.apply_retention("Sized")
+
+    asyncio.run(run())
+    assert [message for _, message in stored(node, "Aged")] == [2, 3, 4]
+    assert node.topic_bytes["Sized"] <= 100
+    assert node.topic_bytes["Sized"] == sum(record["size"] for record in node.topics["Sized"])
+    assert stored(node, "Sized")[-1] == (None, "message-49")
+
+
+def test_compaction_keeps_latest_value_per_key_and_keyless_records(tmp_path):
+    node = make_node(tmp_path)
+
+    async def run():
+        await node.create_topic("State", RetentionPolicy(compact=True))
+        # Store enough messages to span several chunks, skipping publish's per-message logging
+        for i in range(3 * RETENTION_CHUNK):
+            node.store_message("State", i, f"k{i % 3}")
+        await node.publish("State", "unkeyed")
+        await node.publish("State", "latest", "k0")
+        await node.apply_retention("State")
+
+    asyncio.run(run())
+    last = 3 * RETENTION_CHUNK
+    assert stored(node, "State") == [("k1", last - 2), ("k2", last - 1), (None, "unkeyed"), ("k0", "latest")]
+    assert node.topic_bytes["State"] == sum(record["size"] for record in node.topics["State"])
+    assert node.superseded["State"] == 0
+    assert "State" not in node.uncompacted
+
+
+def test_compaction_runs_before_byte_limit(tmp_path):
+    node = make_node(tmp_path)
+
+    async def run():
+        await node.create_topic("State", RetentionPolicy(retention_bytes=200, compact=True))
+        await node.publish("State", "a", "a")
+        for i in range(50):
+            await node.publish("State", f"b{i}", "b")
+        await node.apply_retention("State")
+
+    asyncio.run(run())
+    assert stored(node, "State") == [("a", "a"), ("b", "b49")]
+
+
+def test_publish_rejects_unusable_keys(tmp_path):
+    node = make_node(tmp_path)
+
+    async def run():
+        await node.create_topic("State", RetentionPolicy(compact=True))
+        responses = [json.loads(await node.publish("State", "v", key)) for key in (["z"], {"a": 1}, True, 1.5)]
+        await node.publish("State", "v", 1)
+        return responses
+
+    responses = asyncio.run(run())
+    assert all(response["status"] == "error" for response in responses)
+    assert stored(node, "State") == [(1, "v")]
+
+
+def test_pull_from_offset_returns_only_new_messages(tmp_path):
+    node = make_node(tmp_path)
+
+    async def run():
+        await node.create_topic("Sports", RetentionPolicy(retention_seconds=3600))
+        for i in range(3):
+            await node.publish("Sports", i)
+        first = json.loads(await node.pull("Sports"))
+        await node.publish("Sports", 3)
+        second = json.loads(await node.pull("Sports", offset=first["next_offset"]))
+        third = json.loads(await node.pull("Sports", offset=second["next_offset"]))
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+    assert first["messages"] == [0, 1, 2]
+    assert second["messages"] == [3]
+    assert third["status"] == "error"
+    assert third["next_offset"] == 4
+
+
+def test_pull_reads_large_topics_in_pages(tmp_path):
+    node = make_node(tmp_path)
+
+    async def run():
+        await node.create_topic("State", RetentionPolicy(compact=True))
+        node.topics["State"] = [make_record(i, f"k{i}", offset=i) for i in range(2500)]
+        node.next_offset["State"] = 2500
+        pages = []
+        offset = 0
+        while True:
+            page = json.loads(await node.pull("State", offset=offset, max_messages=None if pages else 700))
+            pages.append(page)
+            offset = page["next_offset"]
+            if not page["more"]:
+                return pages
+
+    pages = asyncio.run(run())
+    assert [len(page["messages"]) for page in pages] == [700, MAX_PULL_MESSAGES, 800]
+    assert [message for page in pages for message in page["messages"]] == list(range(2500))
+    assert pages[-1]["next_offset"] == 2500
+    assert pages[0]["keys"][:2] == ["k0", "k1"]
+
+
+def test_pull_rejects_invalid_page_size(tmp_path):
+    node = make_node(tmp_path)
+    request = json.dumps({"command": "pull", "topic": "State", "max_messages": 0})
+    assert json.loads(asyncio.run(node.process_request(request)))["status"] == "error"
+
+
+def test_compaction_work_follows_new_publishes(tmp_path):
+    node = make_node(tmp_path)
+
+    async def run():
+        await node.create_topic("State", RetentionPolicy(compact=True))
+        for i in range(2000):
+            node.store_message("State", i, f"k{i}")
+        # A few updates hide the old values at once but do not trigger a rebuild of the list
+        for i in range(1000, 1010):
+            node.store_message("State", f"new-{i}", f"k{i}")
+        records = node.topics["State"]
+        await node.apply_retention("State")
+        untouched = node.topics["State"] is records
+        page = json.loads(await node.pull("State", offset=998, max_messages=5))
+        return untouched, page
+
+    untouched, page = asyncio.run(run())
+    assert untouched
+    assert node.superseded["State"] == 10
+    assert page["messages"] == [998, 999, 1010, 1011, 1012]
+    assert page["next_offset"] == 1013
+    assert node.topic_bytes["State"] == sum(
+        record["size"] for record in node.topics["State"] if not record.get("superseded"))
+
+
+def test_retention_forgets_keys_it_trims(tmp_path):
+    node = make_node(tmp_path)
+
+    async def run():
+        await node.create_topic("State", RetentionPolicy(retention_seconds=10, compact=True))
+        node.store_message("State", "old", "a")
+        node.store_message("State", "kept", "b")
+        node.topics["State"][0]["timestamp"] -= 60
+        await node.apply_retention("State")
+        node.store_message("State", "again", "a")
+
+    asyncio.run(run())
+    assert stored(node, "State") == [("b", "kept"), ("a", "again")]
+    assert node.superseded["State"] == 0
+    assert node.key_offsets["State"] == {"b": 1, "a": 2}
+
+
+def test_background_task_trims_topics_despite_a_failing_one(tmp_path):
+    node = make_node(tmp_path)
+    node.retention_interval = 0.01
+
+    async def wait_for_trim(topic, expected):
+        deadline = time.monotonic() + 5
+        while stored(node, topic) != expected:
+            assert time.monotonic() < deadline, f"topic still holds {stored(node, topic)}"
+            await asyncio.sleep(0.01)
+
+    async def run():
+        # A topic whose records are unusable makes every retention pass over it raise
+        node.retention["Broken"] = RetentionPolicy(retention_seconds=1)
+        node.topics["Broken"] = [{"bogus": True}]
+        node.topic_bytes["Broken"] = 0
+        await node.create_topic("Aged", RetentionPolicy(retention_seconds=10))
+
+        task = asyncio.ensure_future(node.enforce_retention())
+        try:
+            for round_number in range(2):
+                node.store_message("Aged", f"old-{round_number}")
+                node.store_message("Aged", f"new-{round_number}")
+                for record in node.topics["Aged"][:-1]:
+                    record["timestamp"] -= 60
+                await wait_for_trim("Aged", [(None, f"new-{round_number}")])
+        finally:
+            node.running = False
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
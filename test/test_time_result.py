@@ -1,17 +1,14 @@
 import asyncio
-import json
 import time
 
-# Helper function to send a query to the indexing server
+from p2p_broker.client import AsyncBrokerClient
+
+client = AsyncBrokerClient()
+
+# Helper function to send a query to the indexing server (bypasses the topic cache on purpose)
 async def query_indexing_server(topic):
-    reader, writer = await asyncio.open_connection("localhost", 6000)
-    command = json.dumps({"command": "query_topic", "topic": topic})
-    writer.write(command.encode())
-    await writer.drain()
-    response = await reader.read(1024)
-    writer.close()
-    await writer.wait_closed()
-    return json.loads(response.decode())
+    return await client.request({"command": "query_topic", "topic": topic},
+                                client.indexing_server_host, client.indexing_server_port)
 
 async def measure_query_time(peer_port, topic):
     start_time = time.time()
@@ -31,6 +28,7 @@ async def run_query_tests():
     
     avg_time = total_time / num_requests
     print(f"Average Query Time for 1000 requests: {avg_time:.5f} seconds")
+    await client.close()
 
 if __name__ == "__main__":
     asyncio.run(run_query_tests())